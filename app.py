@@ -19,6 +19,7 @@ from personality import personality_system
 from audio_handler import voice_handler
 from screen_handler import screen_handler
 from internet_handler import internet_handler
+from startup_check import load_preflight
 
 # Global state
 model_loading_status = {"status": "initializing", "progress": 0}
@@ -90,7 +91,8 @@ def chat_function_streaming(message, history, system_prompt, temperature, max_to
     history.append((message, ""))
     
     # Stream tokens - THIS IS THE CRITICAL FIX
-    for token in model_manager.generate_response_stream(messages, personality_params, context_window):
+    for token in model_manager.generate_response_stream(messages, personality_params, context_window,
+                                                        conversation_id=chat_manager.current_session["id"]):
         full_response += token
         # Update the last message's assistant response
         history[-1] = (message, full_response)
@@ -146,7 +148,8 @@ def regenerate_last(history, system_prompt, temperature, max_tokens,
     history.append((last_user_msg, ""))
     
     # Stream new response
-    for token in model_manager.generate_response_stream(messages, personality_params, context_window):
+    for token in model_manager.generate_response_stream(messages, personality_params, context_window,
+                                                        conversation_id=chat_manager.current_session["id"]):
         full_response += token
         history[-1] = (last_user_msg, full_response)
         yield history
@@ -581,6 +584,12 @@ if __name__ == "__main__":
     print("Local LLM Interface - Fixed Version")
     print("=" * 60)
     print(f"Model: {config.MODEL_NAME}")
+    
+    # A launcher that just ran startup_check already probed the GPU
+    preflight = load_preflight()
+    gpu = preflight and preflight.get("gpu")
+    if gpu and gpu.get("available"):
+        print(f"GPU: {gpu['name']} ({gpu['mem_gb']:.1f}GB, {gpu['free_gb']:.1f}GB free)")
     print("Features:")
     print("  • TRUE token streaming (words appear as generated)")
     print("  • Fixed imports (all handlers working)")
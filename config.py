@@ -5,6 +5,7 @@ Now includes ALL missing attributes referenced in other modules
 """
 
 import os
+import logging
 import yaml
 from pathlib import Path
 
@@ -29,12 +30,33 @@ class Config:
     QUANTIZATION_BITS = 4
     QUANTIZATION_TYPE = "nf4"
     USE_DOUBLE_QUANT = True
-    COMPUTE_DTYPE = "float16"
+    COMPUTE_DTYPE = "bfloat16"  # Native on RTX 40xx, no fp16 overflow in attention softmax
+    
+    # Speculative decoding (small draft model sharing the target's tokenizer)
+    SPECULATIVE = False
+    DRAFT_MODEL_NAME = "google/gemma-3-1b-it"
+    NUM_ASSISTANT_TOKENS = 5
     
     # Context settings - MAXIMIZED for 64GB RAM + RTX 4080
     MAX_CONTEXT_LENGTH = 16384  # 16K tokens! (~65,000 characters)
     DEFAULT_CONTEXT_LENGTH = 12288  # 12K default (~49,000 characters)
     RESERVE_FOR_RESPONSE = 2048  # More room for detailed responses
+    # VRAM kept for reusing conversation KV caches across turns. No effect for
+    # models that bring their own cache class (Gemma 3's sliding-window
+    # HybridCache can't be cropped), nor with STATIC_KV_CACHE
+    KV_CACHE_MAX_GB = 2.0
+    EMPTY_CACHE_EVERY = 0  # Release cached CUDA blocks every N generations (0 = never)
+    
+    # Preallocated fixed-size KV cache (no allocator churn, but no cross-turn KV reuse)
+    STATIC_KV_CACHE = False
+    # Compile the decode step with CUDA graphs (implies STATIC_KV_CACHE)
+    TORCH_COMPILE = False
+    # FlashAttention-2 kernels (needs flash-attn), falling back to PyTorch SDPA
+    FLASH_ATTENTION = True
+    
+    # Request batching for non-streaming generation (1 = off)
+    MAX_BATCH = 1
+    BATCH_WAIT_MS = 5
     
     # Memory allocation
     GPU_MAX_MEMORY = "15GB"
@@ -69,8 +91,9 @@ class Config:
     WHISPER_COMPUTE_TYPE = "float16"
     
     # Screen settings - FIXED: Now defined!
-    SCREENSHOT_FORMAT = "png"
-    SCREENSHOT_QUALITY = 95
+    SCREENSHOT_FORMAT = "webp"  # Much smaller than PNG and keeps text sharp, unlike JPEG
+    SCREENSHOT_QUALITY = 80
+    SCREENSHOT_WEBP_METHOD = 0  # 0 = fastest encode ... 6 = smallest file
     MAX_SCREENSHOT_SIZE = (1920, 1080)  # (width, height)
     REQUIRE_SCREEN_CONFIRMATION = True
     
@@ -106,6 +129,7 @@ class Config:
     SHOW_VRAM_USAGE = True
     SHOW_RAM_USAGE = True
     SHOW_GENERATION_SPEED = True
+    LOG_LEVEL = "INFO"  # DEBUG/INFO/WARNING/ERROR - WARNING silences per-action/per-generation messages
     
     def __init__(self):
         """Initialize configuration and create directories"""
@@ -173,15 +197,34 @@ class Config:
                 self.USE_DOUBLE_QUANT = quant.get('double_quant', self.USE_DOUBLE_QUANT)
                 self.COMPUTE_DTYPE = quant.get('compute_dtype', self.COMPUTE_DTYPE)
             
+            if 'speculative' in model:
+                spec = model['speculative']
+                self.SPECULATIVE = spec.get('enabled', self.SPECULATIVE)
+                self.DRAFT_MODEL_NAME = spec.get('draft_model', self.DRAFT_MODEL_NAME)
+                self.NUM_ASSISTANT_TOKENS = spec.get('num_assistant_tokens', self.NUM_ASSISTANT_TOKENS)
+            
+            if 'performance' in model:
+                perf = model['performance']
+                self.TORCH_COMPILE = perf.get('torch_compile', self.TORCH_COMPILE)
+                self.STATIC_KV_CACHE = perf.get('static_kv_cache', self.STATIC_KV_CACHE)
+                self.FLASH_ATTENTION = perf.get('flash_attention', self.FLASH_ATTENTION)
+            
+            if 'batching' in model:
+                batching = model['batching']
+                self.MAX_BATCH = batching.get('max_batch', self.MAX_BATCH)
+                self.BATCH_WAIT_MS = batching.get('wait_ms', self.BATCH_WAIT_MS)
+            
             if 'context' in model:
                 ctx = model['context']
                 self.MAX_CONTEXT_LENGTH = ctx.get('max_length', self.MAX_CONTEXT_LENGTH)
                 self.DEFAULT_CONTEXT_LENGTH = ctx.get('default_length', self.DEFAULT_CONTEXT_LENGTH)
                 self.RESERVE_FOR_RESPONSE = ctx.get('reserve_for_response', self.RESERVE_FOR_RESPONSE)
+                self.KV_CACHE_MAX_GB = ctx.get('kv_cache_max_gb', self.KV_CACHE_MAX_GB)
             
             if 'memory' in model:
                 mem = model['memory']
                 self.GPU_MAX_MEMORY = mem.get('gpu_max', self.GPU_MAX_MEMORY)
+                self.EMPTY_CACHE_EVERY = mem.get('empty_cache_every', self.EMPTY_CACHE_EVERY)
                 self.CPU_MAX_MEMORY = mem.get('cpu_max', self.CPU_MAX_MEMORY)
                 self.DISK_MAX_MEMORY = mem.get('disk_max', self.DISK_MAX_MEMORY)
             
@@ -224,6 +267,7 @@ class Config:
             screen = user_config['screen']
             self.SCREENSHOT_FORMAT = screen.get('default_screenshot_format', self.SCREENSHOT_FORMAT)
             self.SCREENSHOT_QUALITY = screen.get('screenshot_quality', self.SCREENSHOT_QUALITY)
+            self.SCREENSHOT_WEBP_METHOD = screen.get('webp_method', self.SCREENSHOT_WEBP_METHOD)
             self.MAX_SCREENSHOT_SIZE = tuple(screen.get('max_screenshot_size', list(self.MAX_SCREENSHOT_SIZE)))
             self.REQUIRE_SCREEN_CONFIRMATION = screen.get('require_confirmation', self.REQUIRE_SCREEN_CONFIRMATION)
 
@@ -259,6 +303,7 @@ class Config:
             self.SHOW_VRAM_USAGE = system.get('show_vram_usage', self.SHOW_VRAM_USAGE)
             self.SHOW_RAM_USAGE = system.get('show_ram_usage', self.SHOW_RAM_USAGE)
             self.SHOW_GENERATION_SPEED = system.get('show_generation_speed', self.SHOW_GENERATION_SPEED)
+            self.LOG_LEVEL = system.get('log_level', self.LOG_LEVEL)
         
         # UI settings
         if 'ui' in user_config:
@@ -282,8 +327,6 @@ class Config:
     
     def get_system_info(self):
         """Get current system configuration info"""
-        import torch
-        
         info = {
             "model_name": self.MODEL_NAME,
             "context_window": f"{self.DEFAULT_CONTEXT_LENGTH:,} tokens",
@@ -292,6 +335,17 @@ class Config:
             "stt_engine": self.STT_ENGINE,
         }
         
+        # Prefer a fresh startup_check probe over initializing CUDA here
+        from startup_check import load_preflight
+        preflight = load_preflight()
+        if preflight and preflight.get("gpu"):
+            gpu = preflight["gpu"]
+            info["gpu"] = gpu["name"] if gpu.get("available") else "CPU mode"
+            if gpu.get("available"):
+                info["gpu_memory"] = f"{gpu['mem_gb']:.1f}GB"
+            return info
+        
+        import torch
         if torch.cuda.is_available():
             info["gpu"] = torch.cuda.get_device_name(0)
             info["gpu_memory"] = f"{torch.cuda.get_device_properties(0).total_memory / 1e9:.1f}GB"
@@ -345,3 +399,15 @@ class Config:
 
 # Global configuration instance
 config = Config()
+
+# Modules log through logging.getLogger(__name__); keep the plain console look.
+# Only this app's loggers get the handler - basicConfig() would configure the
+# root logger and change the level and format of every library's output too
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter("%(message)s"))
+for _name in ("model_manager", "screen_handler"):
+    _logger = logging.getLogger(_name)
+    _logger.setLevel(getattr(logging, str(config.LOG_LEVEL).upper(), logging.INFO))
+    if not _logger.handlers:
+        _logger.addHandler(_log_handler)
+    _logger.propagate = False
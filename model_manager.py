@@ -3,99 +3,519 @@ Model Manager Module - ULTIMATE FIX
 Avoids padding completely to prevent CUDA assertion errors
 """
 
+import copy
+import logging
+import time
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig, TextIteratorStreamer
-from threading import Thread
+from collections import OrderedDict
+from concurrent.futures import Future
+from transformers import AutoConfig, AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
+from transformers import DynamicCache, StoppingCriteria, StoppingCriteriaList
+from transformers.generation.streamers import BaseStreamer
+from queue import Queue, Empty, Full
+from threading import Thread, Lock, Event
 from config import config
 
+logger = logging.getLogger(__name__)
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful AI assistant."
+
+class TokenIdStreamer(BaseStreamer):
+    """
+    Streams raw token ids out of generate() without decoding them
+    Decoding happens on the consumer side in batches, keeping the
+    tokenizer out of the generation thread
+    """
+    
+    def __init__(self, timeout=None):
+        self.queue = Queue(maxsize=256)
+        self.stop_signal = None
+        self.timeout = timeout
+        self.next_is_prompt = True
+        self.cancelled = Event()
+    
+    def put(self, value):
+        """Receive new token ids from generate() - the first call is the prompt"""
+        if self.next_is_prompt:
+            self.next_is_prompt = False
+            return
+        if value.dim() > 1:
+            value = value[0]
+        self._put(value.tolist())
+    
+    def end(self):
+        """Signal that generation has finished"""
+        self._put(self.stop_signal)
+    
+    def cancel(self):
+        """Consumer went away - stop generate() and never block it on the full queue"""
+        self.cancelled.set()
+    
+    def _put(self, item):
+        # Bounded queue: wait for the consumer, but give up once it has cancelled
+        while not self.cancelled.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except Full:
+                continue
+    
+    def iter_text(self, tokenizer, chunk_size=8):
+        """
+        Yield decoded text, decoding once per chunk_size new ids
+        Each decode covers only the previous chunk (for spacing context)
+        plus the new ids, so cost stays linear in the response length;
+        the new text is the difference between the two decodes
+        """
+        token_ids = []
+        read_offset = 0  # ids before this are already yielded
+        pending = 0
+        finished = False
+        
+        while not finished:
+            ids = self.queue.get(timeout=self.timeout)
+            if ids is self.stop_signal:
+                finished = True
+            else:
+                token_ids.extend(ids)
+                pending += len(ids)
+                if pending < chunk_size:
+                    continue
+            
+            decode_kwargs = {"skip_special_tokens": True, "clean_up_tokenization_spaces": False}
+            prefix_text = tokenizer.decode(token_ids[:read_offset], **decode_kwargs)
+            text = tokenizer.decode(token_ids, **decode_kwargs)
+            # Hold back incomplete multi-byte characters until more ids arrive
+            if not finished and text.endswith("\ufffd"):
+                continue
+            
+            pending = 0
+            if len(text) > len(prefix_text):
+                yield text[len(prefix_text):]
+            
+            # The yielded chunk becomes the context for the next decode
+            del token_ids[:read_offset]
+            read_offset = len(token_ids)
+
+class CancelledCriteria(StoppingCriteria):
+    """Stops generate() once the streaming consumer has cancelled"""
+    
+    def __init__(self, streamer):
+        self.streamer = streamer
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        cancelled = self.streamer.cancelled.is_set()
+        return torch.full((input_ids.shape[0],), cancelled, dtype=torch.bool, device=input_ids.device)
+
+class RequestBatcher:
+    """
+    Coalesces concurrent generate_response calls into batched generate() calls
+    Requests arriving within BATCH_WAIT_MS of each other (up to MAX_BATCH)
+    with the same sampling settings decode together in one forward pass
+    per step - decode is bandwidth-bound, so extra rows are nearly free
+    """
+    
+    def __init__(self, manager):
+        self.manager = manager
+        self.queue = Queue()
+        self.worker = None
+        self.lock = Lock()
+    
+    def submit(self, messages, personality_params, context_window):
+        """Queue a request and block until its response is ready"""
+        future = Future()
+        self.queue.put((messages, personality_params, context_window, future))
+        
+        with self.lock:
+            # Restart a worker that died, or every waiting caller hangs
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = Thread(target=self._run, daemon=True)
+                self.worker.start()
+        
+        return future.result()
+    
+    def _run(self):
+        """Worker loop - collect a batch, group compatible requests, generate"""
+        while True:
+            pending = [self.queue.get()]
+            deadline = time.monotonic() + config.BATCH_WAIT_MS / 1000
+            while len(pending) < config.MAX_BATCH:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(self.queue.get(timeout=timeout))
+                except Empty:
+                    break
+            
+            # Rows of one generate() call must share sampling and length
+            # settings, and the system prompt every row is formatted with
+            groups = {}
+            for request in pending:
+                _, params, context_window, future = request
+                try:
+                    key = (
+                        context_window,
+                        params.get("max_tokens", 1024),
+                        params.get("system_prompt", DEFAULT_SYSTEM_PROMPT),
+                        self.manager._sampling_key(params),
+                    )
+                except Exception as e:
+                    # Bad params fail their own request, not the worker
+                    future.set_exception(e)
+                    continue
+                groups.setdefault(key, []).append(request)
+            
+            for group in groups.values():
+                _, params, context_window, _ = group[0]
+                try:
+                    responses = self.manager.generate_batch([request[0] for request in group], params, context_window)
+                    for (_, _, _, future), response in zip(group, responses):
+                        future.set_result(response)
+                except Exception as e:
+                    for _, _, _, future in group:
+                        future.set_exception(e)
+
 class ModelManager:
     """Manages the LLM with NO PADDING to avoid CUDA errors"""
     
+    # Survive unload_model() so reloading skips tokenizer and quant setup
+    _TOKENIZER_CACHE = {}  # model name -> tokenizer
+    _QUANT_CONFIG_CACHE = {}  # (quant type, double quant, compute dtype) -> BitsAndBytesConfig
+    _TOK_LEN_CACHE_SIZE = 4096  # Messages whose token counts are remembered
+    
+    # Fixed attribute set - no per-instance __dict__, and typos fail loudly
+    __slots__ = (
+        "model", "tokenizer", "device", "model_loaded", "_param_device", "draft_model",
+        "_gen_cfg_cache", "kv_cache", "system_kv", "_kv_bytes_per_token", "_gen_count",
+        "_static_kv", "_static_kv_lock", "_host_staging", "_staging_done", "_staging_lock",
+        "_batcher", "_tok_len_cache",
+    )
+    
     def __init__(self):
         self.model = None
         self.tokenizer = None
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.model_loaded = False
+        self._param_device = None
+        self.draft_model = None
+        self._gen_cfg_cache = {}
+        self.kv_cache = OrderedDict()  # conversation_id -> (past_key_values, cached_ids)
+        self.system_kv = {}  # hash(system prompt, model) -> (past_key_values, prefix_ids)
+        self._kv_bytes_per_token = 0
+        self._gen_count = 0
+        self._static_kv = None  # Preallocated StaticCache in static/compiled mode
+        self._static_kv_lock = Lock()
+        self._host_staging = None  # Pinned host buffer for prompt H2D copies
+        self._staging_done = None
+        self._staging_lock = Lock()
+        self._batcher = RequestBatcher(self)
+        self._tok_len_cache = OrderedDict()  # formatted message -> token count, LRU, for the loaded tokenizer
     
     def load_model(self):
         """Load model with 4-bit quantization"""
-        print(f"Loading model: {config.MODEL_NAME}")
-        print(f"Target device: {self.device}")
+        if self.model_loaded:
+            logger.info("Model already loaded!")
+            return
+        
+        logger.info("Loading model: %s", config.MODEL_NAME)
+        logger.info("Target device: %s", self.device)
         
         if self.device == "cuda":
-            print(f"GPU: {torch.cuda.get_device_name(0)}")
-            print(f"VRAM: {torch.cuda.get_device_properties(0).total_memory / 1e9:.1f}GB")
-        
-        print("Configuring 4-bit quantization...")
-        quantization_config = BitsAndBytesConfig(
-            load_in_4bit=True,
-            bnb_4bit_quant_type="nf4",
-            bnb_4bit_use_double_quant=True,
-            bnb_4bit_compute_dtype=torch.float16
-        )
+            logger.info("GPU: %s", torch.cuda.get_device_name(0))
+            logger.info("VRAM: %.1fGB", torch.cuda.get_device_properties(0).total_memory / 1e9)
+        
+        logger.info("Configuring 4-bit quantization...")
+        quant_key = (config.QUANTIZATION_TYPE, config.USE_DOUBLE_QUANT, config.COMPUTE_DTYPE)
+        quantization_config = self._QUANT_CONFIG_CACHE.get(quant_key)
+        if quantization_config is None:
+            quantization_config = self._QUANT_CONFIG_CACHE[quant_key] = BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_quant_type=config.QUANTIZATION_TYPE,
+                bnb_4bit_use_double_quant=config.USE_DOUBLE_QUANT,
+                bnb_4bit_compute_dtype=getattr(torch, config.COMPUTE_DTYPE)
+            )
         
-        # Load tokenizer
-        print("Loading tokenizer...")
-        self.tokenizer = AutoTokenizer.from_pretrained(
-            config.MODEL_NAME,
-            trust_remote_code=True
-        )
+        # Load tokenizer - reused across unload/reload cycles
+        self.tokenizer = self._TOKENIZER_CACHE.get(config.MODEL_NAME)
+        if self.tokenizer is None:
+            logger.info("Loading tokenizer...")
+            self.tokenizer = self._TOKENIZER_CACHE[config.MODEL_NAME] = AutoTokenizer.from_pretrained(
+                config.MODEL_NAME,
+                trust_remote_code=True,
+                use_fast=True
+            )
+            if not self.tokenizer.is_fast:
+                logger.warning("⚠ No fast tokenizer available for this model - tokenization will be slower")
         
-        # CRITICAL: Set padding to right side and use eos_token
-        self.tokenizer.padding_side = "left"  # Changed to left for decoder models
-        if self.tokenizer.pad_token is None:
+        # CRITICAL: Left padding for decoder models, eos_token doubles as pad
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token_id is None:
             self.tokenizer.pad_token = self.tokenizer.eos_token
             self.tokenizer.pad_token_id = self.tokenizer.eos_token_id
         
-        print("Loading model (this will take 3-5 minutes)...")
+        device_map = self._choose_device_map()
+        
+        logger.info("Loading model (this will take 3-5 minutes)...")
         
         try:
-            self.model = AutoModelForCausalLM.from_pretrained(
-                config.MODEL_NAME,
-                quantization_config=quantization_config,
-                device_map="auto",
-                trust_remote_code=True,
-                torch_dtype=torch.float16,
-                low_cpu_mem_usage=True
-            )
-            
-            self.model.eval()
-            self.model_loaded = True
+            self.model = self._from_pretrained(quantization_config, device_map=device_map)
             
             if torch.cuda.is_available():
                 allocated = torch.cuda.memory_allocated(0) / 1e9
-                print(f"\nModel loaded successfully!")
-                print(f"GPU Memory: {allocated:.2f}GB")
+                logger.info("Model loaded successfully! GPU Memory: %.2fGB", allocated)
             
         except Exception as e:
-            print(f"\nError loading model: {e}")
-            print("\nTrying fallback loading strategy...")
+            logger.error("Error loading model: %s", e)
+            logger.info("Trying fallback loading strategy...")
             
             try:
                 torch.cuda.empty_cache()
                 
-                self.model = AutoModelForCausalLM.from_pretrained(
-                    config.MODEL_NAME,
-                    quantization_config=quantization_config,
-                    device_map={"": 0},
-                    trust_remote_code=True,
-                    torch_dtype=torch.float16,
-                    low_cpu_mem_usage=True
-                )
-                
-                self.model.eval()
-                self.model_loaded = True
+                fallback_map = {"": 0} if device_map == "auto" else "auto"
+                self.model = self._from_pretrained(quantization_config, device_map=fallback_map)
                 
                 if torch.cuda.is_available():
                     allocated = torch.cuda.memory_allocated(0) / 1e9
-                    print(f"\nModel loaded successfully (fallback method)!")
-                    print(f"GPU Memory: {allocated:.2f}GB")
+                    logger.info("Model loaded successfully (fallback method)! GPU Memory: %.2fGB", allocated)
                 
             except Exception as e2:
-                print(f"\nFallback also failed: {e2}")
+                logger.error("Fallback also failed: %s", e2)
                 raise
+        
+        self.model.eval()
+        
+        # The input device never changes after load, so resolve it once
+        self._param_device = next(self.model.parameters()).device
+        self._allocate_host_staging()
+        
+        # Size of one token's keys/values across all layers, for the KV cache budget
+        text_config = getattr(self.model.config, "text_config", self.model.config)
+        head_dim = getattr(text_config, "head_dim", None) or text_config.hidden_size // text_config.num_attention_heads
+        kv_heads = getattr(text_config, "num_key_value_heads", None) or text_config.num_attention_heads
+        dtype_bytes = torch.tensor([], dtype=self.model.dtype).element_size()
+        self._kv_bytes_per_token = 2 * text_config.num_hidden_layers * kv_heads * head_dim * dtype_bytes
+        
+        # Make pad/eos canonical on the generation config so per-request
+        # kwargs don't have to repeat them
+        self.model.generation_config.pad_token_id = self.tokenizer.pad_token_id
+        self.model.generation_config.eos_token_id = self.tokenizer.eos_token_id
+        
+        if config.STATIC_KV_CACHE or config.TORCH_COMPILE:
+            self._allocate_static_kv()
+        
+        if config.TORCH_COMPILE and self._static_kv is not None:
+            self._compile_decode_step()
+        
+        if config.SPECULATIVE:
+            self._load_draft_model()
+        
+        # See _reuse_kv_cache - say so rather than silently ignoring kv_cache_max_gb
+        cache_implementation = self.model.generation_config.cache_implementation
+        if cache_implementation is not None and self._static_kv is None:
+            logger.info("ℹ Model uses its own '%s' KV cache - cross-turn KV reuse is off", cache_implementation)
+        
+        self.model_loaded = True
     
-    def generate_response_stream(self, messages, personality_params, context_window=None):
+    def _allocate_static_kv(self):
+        """
+        Preallocate one fixed-size KV cache reused by every request
+        Decode writes into the same buffers each turn instead of growing
+        and freeing fresh tensors, so the allocator never churns. Trades
+        away cross-turn KV reuse, since a static cache can't be cropped
+        """
+        from transformers import StaticCache
+        
+        try:
+            self._static_kv = StaticCache(
+                config=self.model.config,
+                max_batch_size=1,
+                max_cache_len=config.DEFAULT_CONTEXT_LENGTH,
+                device=self._param_device,
+                dtype=self.model.dtype
+            )
+        except Exception as e:
+            logger.warning("⚠ Could not preallocate static KV cache: %s", e)
+            return
+        
+        size_gb = config.DEFAULT_CONTEXT_LENGTH * self._kv_bytes_per_token / 1e9
+        logger.info("✓ Static KV cache: %d tokens (~%.1fGB)", config.DEFAULT_CONTEXT_LENGTH, size_gb)
+    
+    def _claim_static_kv(self, total_tokens):
+        """
+        Hand out the preallocated static cache, reset for a new sequence
+        Returns None - generate() then allocates its own - when the request
+        doesn't fit the buffer or another generation is using it
+        """
+        if total_tokens > self._static_kv.max_cache_len or not self._static_kv_lock.acquire(blocking=False):
+            return None
+        self._static_kv.reset()
+        return self._static_kv
+    
+    def _compile_decode_step(self):
+        """
+        Compile the forward pass so decode steps replay as CUDA graphs
+        Relies on the static KV cache so every step sees the same shapes.
+        Only single-token, single-row steps take the compiled path - prefill
+        lengths differ per prompt and would each recompile and recapture.
+        Static cache + bitsandbytes 4-bit is not guaranteed to trace, so a
+        warmup generate() runs here and any failure reverts to eager mode
+        """
+        if not (hasattr(torch, "compile") and torch.cuda.is_available()):
+            logger.warning("⚠ torch.compile needs PyTorch 2.x with CUDA - staying in eager mode")
+            return
+        
+        logger.info("Compiling decode step (warmup can take a few minutes)...")
+        eager_forward = self.model.forward
+        try:
+            compiled_forward = torch.compile(eager_forward, mode="reduce-overhead", fullgraph=False, dynamic=False)
+            
+            def forward(*args, **kwargs):
+                input_ids = kwargs.get("input_ids", args[0] if args else None)
+                if input_ids is None or input_ids.shape != (1, 1):
+                    return eager_forward(*args, **kwargs)
+                return compiled_forward(*args, **kwargs)
+            
+            self.model.forward = forward
+            
+            warmup = self.tokenizer("Hello", return_tensors="pt").to(self._param_device)
+            past_key_values = self._claim_static_kv(warmup["input_ids"].shape[1] + 4)
+            try:
+                with torch.inference_mode():
+                    self.model.generate(**warmup, past_key_values=past_key_values, cache_implementation=None, max_new_tokens=4)
+            finally:
+                if past_key_values is not None:
+                    self._static_kv_lock.release()
+            
+            logger.info("✓ Decode step compiled")
+        except Exception as e:
+            self.model.forward = eager_forward
+            logger.warning("⚠ torch.compile failed, using eager mode: %s: %s", type(e).__name__, e)
+    
+    def _choose_device_map(self):
+        """
+        Pin the whole model to GPU 0 when the quantized weights fit
+        device_map="auto" installs accelerate hooks on every layer's forward
+        even when nothing is offloaded, which slows every decode step
+        """
+        if self.device != "cuda":
+            return "auto"
+        
+        try:
+            from accelerate import init_empty_weights
+            
+            # Count parameters on a weightless skeleton - no download, no memory
+            with init_empty_weights():
+                skeleton = AutoModelForCausalLM.from_config(
+                    AutoConfig.from_pretrained(config.MODEL_NAME, trust_remote_code=True),
+                    trust_remote_code=True
+                )
+            n_params = sum(p.numel() for p in skeleton.parameters())
+            del skeleton
+            
+            gpu_bytes = float(config.GPU_MAX_MEMORY.upper().removesuffix("GB")) * 1e9
+        except Exception as e:
+            logger.warning("⚠ Could not estimate model size (%s), using automatic placement", e)
+            return "auto"
+        
+        # 20% margin for unquantized embeddings/norms and quantization constants
+        weight_bytes = n_params * config.QUANTIZATION_BITS / 8 * 1.2
+        
+        if weight_bytes < gpu_bytes:
+            logger.info("Weights (~%.1fGB) fit in %s - placing on GPU 0", weight_bytes / 1e9, config.GPU_MAX_MEMORY)
+            return {"": 0}
+        
+        logger.info("Weights (~%.1fGB) exceed %s - offloading to CPU", weight_bytes / 1e9, config.GPU_MAX_MEMORY)
+        return "auto"
+    
+    def _from_pretrained(self, quantization_config, device_map):
+        """Load the main model weights, with FlashAttention-2 if enabled, else PyTorch SDPA"""
+        load_kwargs = {
+            "quantization_config": quantization_config,
+            "device_map": device_map,
+            "trust_remote_code": True,
+            "torch_dtype": getattr(torch, config.COMPUTE_DTYPE),
+            "low_cpu_mem_usage": True
+        }
+        if device_map == "auto":
+            load_kwargs["max_memory"] = {0: config.GPU_MAX_MEMORY, "cpu": config.CPU_MAX_MEMORY}
+            load_kwargs["offload_folder"] = str(config.OFFLOAD_DIR)
+        if config.FLASH_ATTENTION:
+            try:
+                model = AutoModelForCausalLM.from_pretrained(
+                    config.MODEL_NAME,
+                    attn_implementation="flash_attention_2",
+                    **load_kwargs
+                )
+                logger.info("✓ FlashAttention-2 enabled")
+                return model
+            except (ImportError, ValueError) as e:
+                logger.warning("⚠ FlashAttention-2 unavailable (%s), using PyTorch SDPA attention", e)
+        return AutoModelForCausalLM.from_pretrained(
+            config.MODEL_NAME,
+            attn_implementation="sdpa",
+            **load_kwargs
+        )
+    
+    def _load_draft_model(self):
+        """Load the small draft model used for speculative decoding"""
+        logger.info("Loading draft model for speculative decoding: %s", config.DRAFT_MODEL_NAME)
+        try:
+            self.draft_model = AutoModelForCausalLM.from_pretrained(
+                config.DRAFT_MODEL_NAME,
+                device_map={"": self._param_device},
+                torch_dtype=getattr(torch, config.COMPUTE_DTYPE),
+                low_cpu_mem_usage=True
+            )
+            self.draft_model.eval()
+            logger.info("✓ Speculative decoding enabled")
+        except Exception as e:
+            self.draft_model = None
+            logger.warning("⚠ Draft model unavailable, using standard decoding: %s", e)
+    
+    def _get_generation_config(self, personality_params):
+        """
+        Return a cached GenerationConfig for these sampling parameters
+        Personalities only produce a handful of distinct combinations,
+        so each request reuses a prebuilt config instead of a fresh dict
+        """
+        key = self._sampling_key(personality_params)
+        gen_config = self._gen_cfg_cache.get(key)
+        if gen_config is None:
+            temperature, top_p, top_k, repetition_penalty = key
+            # Start from the model's config so pad/eos and model defaults carry over
+            gen_config = copy.deepcopy(self.model.generation_config)
+            gen_config.update(
+                temperature=temperature,
+                top_p=top_p,
+                top_k=top_k,
+                repetition_penalty=repetition_penalty,
+                do_sample=True,
+                use_cache=True
+            )
+            self._gen_cfg_cache[key] = gen_config
+        return gen_config
+    
+    def _sampling_key(self, personality_params):
+        """(temperature, top_p, top_k, repetition_penalty) for a request"""
+        return (
+            max(0.1, personality_params.get("temperature", 0.7)),  # Avoid 0
+            personality_params.get("top_p", 0.9),
+            personality_params.get("top_k", 50),
+            personality_params.get("repetition_penalty", 1.1),
+        )
+    
+    def _assistant_kwargs(self):
+        """Extra generate() kwargs for speculative decoding, empty when disabled"""
+        if self.draft_model is None:
+            return {}
+        return {
+            "assistant_model": self.draft_model,
+            "num_assistant_tokens": config.NUM_ASSISTANT_TOKENS
+        }
+    
+    def generate_response_stream(self, messages, personality_params, context_window=None,
+                                 conversation_id="default"):
         """Generate response with token streaming - NO PADDING VERSION"""
         if not self.model_loaded:
             yield "Model not loaded yet. Please wait..."
@@ -117,8 +537,9 @@ class ModelManager:
         )
         
         # Move to device
-        input_ids = inputs["input_ids"].to(self.device)
-        attention_mask = inputs["attention_mask"].to(self.device)
+        inputs = self._move_inputs_to_device(inputs)
+        input_ids = inputs["input_ids"]
+        attention_mask = inputs["attention_mask"]
         
         # Calculate max new tokens
         prompt_length = input_ids.shape[1]
@@ -131,156 +552,374 @@ class ModelManager:
             yield "Error: Context is full. Please clear chat or reduce context window."
             return
         
+        logger.info("Generating (prompt: %d tokens, max new: %d)...", prompt_length, max_new_tokens)
+        
         # Create streamer
-        streamer = TextIteratorStreamer(
-            self.tokenizer,
-            skip_prompt=True,
-            skip_special_tokens=True
-        )
+        streamer = TokenIdStreamer()
         
         # Generation kwargs - SIMPLIFIED
         generation_kwargs = {
             "input_ids": input_ids,
             "attention_mask": attention_mask,
+            "past_key_values": (
+                self._claim_static_kv(prompt_length + max_new_tokens) if self._static_kv is not None
+                else self._reuse_kv_cache(conversation_id, input_ids, personality_params)
+            ),
+            "return_dict_in_generate": True,
+            "generation_config": self._get_generation_config(personality_params),
             "max_new_tokens": max_new_tokens,
-            "temperature": max(0.1, personality_params.get("temperature", 0.7)),  # Avoid 0
-            "top_p": personality_params.get("top_p", 0.9),
-            "top_k": personality_params.get("top_k", 50),
-            "repetition_penalty": personality_params.get("repetition_penalty", 1.1),
-            "do_sample": True,
-            "eos_token_id": self.tokenizer.eos_token_id,
-            "pad_token_id": self.tokenizer.eos_token_id,  # Use eos as pad
             "streamer": streamer,
-            "use_cache": True
+            "stopping_criteria": StoppingCriteriaList([CancelledCriteria(streamer)]),
+            **self._assistant_kwargs()
         }
+        # A passed cache object replaces the model's default cache class -
+        # generate() rejects it alongside a cache_implementation
+        if generation_kwargs["past_key_values"] is not None:
+            generation_kwargs["cache_implementation"] = None
         
         # Start generation in thread
         generation_thread = Thread(
             target=self._generate_with_streamer,
+            args=(conversation_id,),
             kwargs=generation_kwargs
         )
         generation_thread.start()
         
         # Yield tokens
         try:
-            for token in streamer:
+            for token in streamer.iter_text(self.tokenizer):
                 yield token
         except Exception as e:
             yield f"\n\nError during generation: {e}"
-        
-        # Wait for completion
-        generation_thread.join()
-        
-        # Safe cache clearing
-        try:
-            if torch.cuda.is_available():
-                torch.cuda.synchronize()
-                torch.cuda.empty_cache()
-        except:
-            pass
+        finally:
+            # Also runs when the consumer stops early (Stop button, disconnect):
+            # without it generate() would block on the full queue forever,
+            # holding its KV tensors and the static cache lock
+            streamer.cancel()
+            # Wait for completion - the caching allocator reuses this memory next call
+            generation_thread.join()
+            self._after_generation()
     
-    def generate_response(self, messages, personality_params, context_window=None):
-        """Non-streaming generation - NO PADDING VERSION"""
+    def generate_response(self, messages, personality_params, context_window=None,
+                          conversation_id="default"):
+        """
+        Non-streaming generation - collects generate_response_stream()
+        Callers that can show partial output should iterate the stream
+        instead, so the first words appear right after prefill
+        With MAX_BATCH > 1 concurrent calls are batched together instead
+        """
+        if config.MAX_BATCH > 1:
+            if context_window is None:
+                context_window = personality_params.get("context_window", config.DEFAULT_CONTEXT_LENGTH)
+            return self._batcher.submit(messages, personality_params, context_window)
+        
+        chunks = self.generate_response_stream(messages, personality_params, context_window, conversation_id)
+        return "".join(chunks).strip()
+    
+    def generate_batch(self, batch_messages, personality_params, context_window=None):
+        """
+        Generate responses for several conversations in one generate() call
+        Prompts are left-padded so all rows decode in lockstep; rows that hit
+        eos just emit padding until the longest one finishes. Batched rows
+        start without a reused KV cache, since per-conversation caches of
+        different lengths can't share one batch cache
+        """
         if not self.model_loaded:
-            return "Model not loaded yet. Please wait..."
+            return ["Model not loaded yet. Please wait..."] * len(batch_messages)
         
         if context_window is None:
             context_window = personality_params.get("context_window", config.DEFAULT_CONTEXT_LENGTH)
         
-        # Format messages
-        prompt = self._format_messages(messages, personality_params, context_window)
-        
-        # NO PADDING - just encode
+        prompts = [
+            self._format_messages(messages, personality_params, context_window)
+            for messages in batch_messages
+        ]
         inputs = self.tokenizer(
-            prompt,
+            prompts,
             return_tensors="pt",
+            padding=True,
             truncation=True,
             max_length=context_window,
             add_special_tokens=True
         )
+        inputs = self._move_inputs_to_device(inputs)
         
-        # Move to device
-        input_ids = inputs["input_ids"].to(self.device)
-        attention_mask = inputs["attention_mask"].to(self.device)
-        
-        # Calculate max tokens
-        prompt_length = input_ids.shape[1]
+        prompt_length = inputs["input_ids"].shape[1]
         max_new_tokens = min(
             personality_params.get("max_tokens", 1024),
             context_window - prompt_length - 50
         )
         
-        print(f"Generating (prompt: {prompt_length} tokens, max new: {max_new_tokens})...")
+        if max_new_tokens < 10:
+            return ["Error: Context is full. Please clear chat or reduce context window."] * len(batch_messages)
         
-        # Generate
-        with torch.no_grad():
+        logger.info("Generating batch of %d (prompt: %d tokens, max new: %d)...", len(prompts), prompt_length, max_new_tokens)
+        
+        # Batched requests get HF-managed static caches of their own. Set per
+        # call, not on the shared generation config: generate() rejects a
+        # cache_implementation alongside the past_key_values streaming passes
+        cache_kwargs = {"cache_implementation": "static"} if self._static_kv is not None else {}
+        with torch.inference_mode():
             outputs = self.model.generate(
-                input_ids=input_ids,
-                attention_mask=attention_mask,
+                input_ids=inputs["input_ids"],
+                attention_mask=inputs["attention_mask"],
+                generation_config=self._get_generation_config(personality_params),
                 max_new_tokens=max_new_tokens,
-                temperature=max(0.1, personality_params.get("temperature", 0.7)),
-                top_p=personality_params.get("top_p", 0.9),
-                top_k=personality_params.get("top_k", 50),
-                repetition_penalty=personality_params.get("repetition_penalty", 1.1),
-                do_sample=True,
-                eos_token_id=self.tokenizer.eos_token_id,
-                pad_token_id=self.tokenizer.eos_token_id,
-                use_cache=True
+                **cache_kwargs
             )
+        self._after_generation()
         
-        # Decode
-        response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-        response = response[len(prompt):].strip()
-        
-        # Safe cache clearing
+        responses = self.tokenizer.batch_decode(outputs[:, prompt_length:], skip_special_tokens=True)
+        return [response.strip() for response in responses]
+    
+    def _after_generation(self):
+        """
+        Per-request bookkeeping, with an optional periodic allocator cleanup
+        Deliberately does not call torch.cuda.empty_cache() per request:
+        decode allocates the same shapes every turn, so releasing the
+        cached blocks only forces the next call to reallocate them.
+        Set EMPTY_CACHE_EVERY if fragmentation becomes a problem
+        """
+        self._gen_count += 1
+        if (config.EMPTY_CACHE_EVERY and torch.cuda.is_available()
+                and self._gen_count % config.EMPTY_CACHE_EVERY == 0):
+            torch.cuda.empty_cache()
+    
+    def _reuse_kv_cache(self, conversation_id, input_ids, personality_params):
+        """
+        Return the KV cache for the longest prefix of input_ids already
+        computed in this conversation, or None
+        generate() then only runs prefill over the uncached suffix - a new
+        turn costs O(new tokens) instead of re-reading the whole history
+        New conversations start from the precomputed system prompt cache
+        """
+        # Static mode reuses one preallocated cache instead. Models that
+        # pick their own cache class (Gemma 3's sliding-window HybridCache)
+        # can't be cropped, so they keep generate()'s default cache
+        if self._static_kv is not None or self.model.generation_config.cache_implementation is not None:
+            return None
+        
+        entry = self.kv_cache.pop(conversation_id, None)
+        if entry is not None:
+            past_key_values = self._crop_to_shared_prefix(entry, input_ids)
+            if past_key_values is not None:
+                return past_key_values
+        
+        system_prompt = personality_params.get("system_prompt", DEFAULT_SYSTEM_PROMPT)
+        past_key_values = self._crop_to_shared_prefix(self._system_prompt_cache(system_prompt), input_ids)
+        # Pass an explicit DynamicCache so generate() returns one to store,
+        # never a legacy tuple cache
+        return past_key_values if past_key_values is not None else DynamicCache()
+    
+    def _system_prompt_cache(self, system_prompt):
+        """
+        Return a private copy of the KV cache for the system prompt prefix
+        Computed once per system prompt; generate() derives cache positions
+        from the cache length, so RoPE positions for the rest of the prompt
+        start right after the prefix
+        """
+        key = hash((system_prompt, config.MODEL_NAME))
+        entry = self.system_kv.get(key)
+        if entry is None:
+            prefix_ids = self.tokenizer(
+                self._format_system_prefix(system_prompt),
+                return_tensors="pt",
+                add_special_tokens=True
+            )["input_ids"].to(self._param_device)
+            
+            with torch.inference_mode():
+                outputs = self.model(input_ids=prefix_ids, past_key_values=DynamicCache(), use_cache=True)
+            
+            # Only the active personality's prefix is worth keeping
+            self.system_kv.clear()
+            entry = self.system_kv[key] = (outputs.past_key_values, prefix_ids[0])
+        
+        past_key_values, prefix_ids = entry
+        # A model that swapped in another cache class can't be cropped later
+        if not isinstance(past_key_values, DynamicCache):
+            return None, prefix_ids
+        # generate() extends the cache in place, so hand out a copy
+        return copy.deepcopy(past_key_values), prefix_ids
+    
+    def _crop_to_shared_prefix(self, entry, input_ids):
+        """Crop a cached (past_key_values, cached_ids) pair to the prefix it shares with input_ids"""
+        past_key_values, cached_ids = entry
+        if not isinstance(past_key_values, DynamicCache):
+            return None
+        new_ids = input_ids[0]
+        
+        # Always leave at least one token for generate() to prefill
+        limit = min(cached_ids.shape[0], new_ids.shape[0] - 1)
+        if limit <= 0:
+            return None
+        
+        mismatch = (cached_ids[:limit] != new_ids[:limit]).nonzero()
+        prefix_len = int(mismatch[0]) if len(mismatch) else limit
+        if prefix_len == 0:
+            return None
+        
+        # Older turns dropped by _format_messages change the prefix, so this
+        # naturally falls back to reusing just the shared system prompt.
+        # Slicing out the middle of the cache instead would leave the
+        # remaining keys with stale rotary positions
         try:
-            if torch.cuda.is_available():
-                torch.cuda.synchronize()
-                torch.cuda.empty_cache()
-        except:
-            pass
+            past_key_values.crop(prefix_len)
+        except Exception as e:
+            logger.warning("⚠ Could not reuse KV cache: %s", e)
+            return None
+        return past_key_values
+    
+    def _store_kv_cache(self, conversation_id, outputs):
+        """Keep this turn's KV cache for the next turn, evicting LRU conversations past the budget"""
+        past_key_values = outputs.past_key_values
+        # Only a DynamicCache can be cropped and extended next turn
+        if not isinstance(past_key_values, DynamicCache) or self._static_kv is not None:
+            return
         
-        return response
+        cached_len = past_key_values.get_seq_length()
+        self.kv_cache[conversation_id] = (past_key_values, outputs.sequences[0, :cached_len])
+        self.kv_cache.move_to_end(conversation_id)
+        
+        budget = config.KV_CACHE_MAX_GB * 1e9
+        while self.kv_cache and self._kv_cache_bytes() > budget:
+            self.kv_cache.popitem(last=False)
+    
+    def _kv_cache_bytes(self):
+        """Total bytes held by cached conversations"""
+        cached_tokens = sum(cached_ids.shape[0] for _, cached_ids in self.kv_cache.values())
+        return cached_tokens * self._kv_bytes_per_token
     
     def _format_messages(self, messages, personality_params, context_window):
         """Format messages into prompt string"""
-        system_prompt = personality_params.get("system_prompt", "You are a helpful AI assistant.")
-        
-        # Calculate available space
-        available_tokens = context_window - personality_params.get("max_tokens", 1024) - 200
-        available_chars = available_tokens * 4
-        
-        # Start with system prompt
-        formatted = f"{system_prompt}\n\n"
-        current_length = len(formatted)
-        
-        # Add messages from most recent backwards
-        included_messages = []
-        for msg in reversed(messages):
-            msg_text = f"{msg['role'].capitalize()}: {msg['content']}\n\n"
-            if current_length + len(msg_text) < available_chars:
-                included_messages.insert(0, msg_text)
-                current_length += len(msg_text)
-            else:
-                break
+        system_prompt = personality_params.get("system_prompt", DEFAULT_SYSTEM_PROMPT)
+        
+        system_prefix = self._format_system_prefix(system_prompt)
+        
+        # Token budget left for history once the system prompt is in
+        budget = (context_window - personality_params.get("max_tokens", 1024) - 200
+                  - self.estimate_tokens(system_prefix))
         
-        formatted += "".join(included_messages)
-        formatted += "Assistant:"
+        # Exact per-message token counts, tokenized once per message
+        texts = [self._format_message(msg) for msg in messages]
+        lengths = self._token_lengths(texts)
         
-        return formatted
+        # Walk back from the most recent message using only the cached counts
+        start = len(messages)
+        while start > 0 and lengths[start - 1] < budget:
+            start -= 1
+            budget -= lengths[start]
+        
+        # Build the prompt text once, for the included slice only
+        fragments = [system_prefix]
+        fragments.extend(texts[start:])
+        fragments.append("Assistant:")
+        return "".join(fragments)
+    
+    def _allocate_host_staging(self):
+        """
+        Pin one host buffer big enough for a full batch of ids + masks
+        Copies out of pageable memory are synchronous; out of pinned memory
+        they are real async DMA, so tokenizing can overlap the transfer
+        """
+        if self._param_device.type != "cuda":
+            return
+        
+        size = 2 * max(1, config.MAX_BATCH) * config.DEFAULT_CONTEXT_LENGTH
+        try:
+            self._host_staging = torch.empty(size, dtype=torch.long, pin_memory=True)
+            self._staging_done = torch.cuda.Event()
+        except RuntimeError as e:
+            logger.warning("⚠ Could not pin host staging buffer: %s", e)
     
-    def _generate_with_streamer(self, **kwargs):
+    def _move_inputs_to_device(self, inputs):
+        """Move tokenized inputs to the device holding the model's first weights"""
+        tensors = [value for value in inputs.values() if torch.is_tensor(value)]
+        needed = sum(t.numel() for t in tensors)
+        
+        # Oversized prompts (context_window above the default) take the plain path
+        if (self._host_staging is None or needed > self._host_staging.numel()
+                or any(t.dtype != torch.long for t in tensors)):
+            return inputs.to(self._param_device, non_blocking=True)
+        
+        with self._staging_lock:
+            # The previous request's DMA may still be reading the buffer
+            self._staging_done.synchronize()
+            
+            offset = 0
+            for key, value in inputs.items():
+                if not torch.is_tensor(value):
+                    continue
+                staged = self._host_staging[offset:offset + value.numel()].view(value.shape)
+                staged.copy_(value)
+                inputs[key] = staged.to(self._param_device, non_blocking=True)
+                offset += value.numel()
+            
+            self._staging_done.record()
+        
+        return inputs
+    
+    def estimate_tokens(self, text):
+        """Estimate token count for a text string"""
+        if self.tokenizer:
+            return len(self.tokenizer.encode(text))
+        else:
+            # Rough estimation if tokenizer not loaded
+            return len(text) // 4
+    
+    def _format_message(self, msg):
+        """Prompt text for a single chat message"""
+        return f"{msg['role'].capitalize()}: {msg['content']}\n\n"
+    
+    def _token_lengths(self, texts):
+        """
+        Token count of each formatted message
+        Counts live in a side cache rather than on the caller's message
+        dicts, so they never end up in saved sessions or outlive the
+        tokenizer; only texts not seen before are tokenized, in one batch call
+        """
+        if self.tokenizer is None:
+            return [self.estimate_tokens(text) for text in texts]
+        
+        cache = self._tok_len_cache
+        missing = [text for text in dict.fromkeys(texts) if text not in cache]
+        found = {text: cache[text] for text in texts if text in cache}
+        if missing:
+            lengths = self.tokenizer(missing, add_special_tokens=False, return_length=True)["length"]
+            found.update(zip(missing, lengths))
+        
+        # Refresh this conversation's entries, then drop the least recently used
+        for text, length in found.items():
+            cache[text] = length
+            cache.move_to_end(text)
+        while len(cache) > self._TOK_LEN_CACHE_SIZE:
+            cache.popitem(last=False)
+        
+        return [found[text] for text in texts]
+    
+    def _format_system_prefix(self, system_prompt):
+        """Prompt text preceding the conversation - shared by every turn"""
+        return f"{system_prompt}\n\n"
+    
+    def _generate_with_streamer(self, conversation_id, **kwargs):
         """Run generation with error handling"""
         try:
-            self.model.generate(**kwargs)
+            # Cached KV tensors are inference tensors - they must be extended
+            # inside inference mode too, generate()'s own no_grad isn't enough
+            with torch.inference_mode():
+                outputs = self.model.generate(**kwargs)
+            self._store_kv_cache(conversation_id, outputs)
         except Exception as e:
-            print(f"Generation error: {e}")
+            logger.error("Generation error: %s", e)
             streamer = kwargs.get("streamer")
             if streamer:
                 try:
                     streamer.end()
                 except:
                     pass
+        finally:
+            past_key_values = kwargs.get("past_key_values")
+            if past_key_values is not None and past_key_values is self._static_kv:
+                self._static_kv_lock.release()
     
     def get_model_info(self):
         """Get model information"""
@@ -295,7 +934,7 @@ class ModelManager:
             "loaded": True,
             "name": config.MODEL_NAME,
             "device": self.device,
-            "quantization": "4-bit NF4"
+            "quantization": f"{config.QUANTIZATION_BITS}-bit {config.QUANTIZATION_TYPE.upper()}"
         }
         
         if torch.cuda.is_available():
@@ -310,16 +949,28 @@ class ModelManager:
             del self.model
             self.model = None
         
+        if self.draft_model is not None:
+            del self.draft_model
+            self.draft_model = None
+        
         if self.tokenizer is not None:
             del self.tokenizer
             self.tokenizer = None
         
         self.model_loaded = False
+        self._param_device = None
+        self._static_kv = None
+        self._host_staging = None
+        self._staging_done = None
+        self._gen_cfg_cache.clear()
+        self._tok_len_cache.clear()
+        self.kv_cache.clear()
+        self.system_kv.clear()
         
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
         
-        print("Model unloaded from memory")
+        logger.info("Model unloaded from memory")
 
 # Global model manager instance
 model_manager = ModelManager()
@@ -4,6 +4,86 @@ Define VIBES and EMOTIONS, not scripted responses
 This allows natural variation while maintaining consistent tone/energy
 """
 
+import functools
+
+def _dimension_level(value):
+    """Bucket a 0-100 dimension value the same way prompts and descriptions do"""
+    if value < 35:
+        return "low"
+    elif value > 65:
+        return "high"
+    return "balanced"
+
+@functools.lru_cache(maxsize=64)
+def _build_system_prompt(levels, custom_instructions):
+    """Assemble the system prompt from bucketed dimension levels"""
+    level = dict(levels)
+    
+    # Start with base instruction
+    prompt_parts = ["You are an AI assistant."]
+    
+    # Add communication style based on dimensions
+    style_parts = []
+    
+    # Formality
+    if level["formality"] == "low":
+        style_parts.append("Communicate in a casual, conversational manner")
+    elif level["formality"] == "high":
+        style_parts.append("Maintain a professional and formal tone")
+    
+    # Directness
+    if level["directness"] == "low":
+        style_parts.append("Be diplomatic and consider multiple perspectives")
+    elif level["directness"] == "high":
+        style_parts.append("Be direct and get straight to the point")
+    
+    # Verbosity
+    if level["verbosity"] == "low":
+        style_parts.append("Keep responses concise and brief")
+    elif level["verbosity"] == "high":
+        style_parts.append("Provide thorough and detailed explanations")
+    
+    # Technical depth
+    if level["technicality"] == "low":
+        style_parts.append("Explain concepts in simple, accessible terms")
+    elif level["technicality"] == "high":
+        style_parts.append("Use technical language and dive into details")
+    
+    # Supportiveness
+    if level["supportiveness"] == "high":
+        style_parts.append("Be encouraging and empathetic")
+    
+    # Playfulness
+    if level["playfulness"] == "high":
+        style_parts.append("Feel free to be witty and use humor when appropriate")
+    elif level["playfulness"] == "low":
+        style_parts.append("Stay focused and serious")
+    
+    # Assertiveness
+    if level["assertiveness"] == "low":
+        style_parts.append("Offer suggestions tentatively and ask for feedback")
+    elif level["assertiveness"] == "high":
+        style_parts.append("Be confident and decisive in your responses")
+    
+    # Enthusiasm
+    if level["enthusiasm"] == "high":
+        style_parts.append("Show genuine interest and energy in discussions")
+    elif level["enthusiasm"] == "low":
+        style_parts.append("Maintain a calm and measured demeanor")
+    
+    # Combine style directives
+    if style_parts:
+        prompt_parts.append("Communication style: " + ". ".join(style_parts) + ".")
+    
+    # Add custom instructions if provided
+    if custom_instructions:
+        prompt_parts.append(f"\nAdditional guidance: {custom_instructions}")
+    
+    # IMPORTANT: Add anti-scripting reminder
+    prompt_parts.append("\nRespond naturally and authentically. Never use canned phrases or templated responses. Let each answer be unique and contextual.")
+    
+    return "\n\n".join(prompt_parts)
+
 class PersonalitySystem:
     """
     Manages personality through traits, emotions, and communication style
@@ -170,71 +250,13 @@ class PersonalitySystem:
         Build a system prompt based on personality dimensions
         Focuses on TONE and APPROACH, not specific phrases
         """
-        
-        # Start with base instruction
-        prompt_parts = ["You are an AI assistant."]
-        
-        # Add communication style based on dimensions
-        style_parts = []
-        
-        # Formality
-        if dimensions.get("formality", 50) < 35:
-            style_parts.append("Communicate in a casual, conversational manner")
-        elif dimensions.get("formality", 50) > 65:
-            style_parts.append("Maintain a professional and formal tone")
-        
-        # Directness
-        if dimensions.get("directness", 50) < 35:
-            style_parts.append("Be diplomatic and consider multiple perspectives")
-        elif dimensions.get("directness", 50) > 65:
-            style_parts.append("Be direct and get straight to the point")
-        
-        # Verbosity
-        if dimensions.get("verbosity", 50) < 35:
-            style_parts.append("Keep responses concise and brief")
-        elif dimensions.get("verbosity", 50) > 65:
-            style_parts.append("Provide thorough and detailed explanations")
-        
-        # Technical depth
-        if dimensions.get("technicality", 50) < 35:
-            style_parts.append("Explain concepts in simple, accessible terms")
-        elif dimensions.get("technicality", 50) > 65:
-            style_parts.append("Use technical language and dive into details")
-        
-        # Supportiveness
-        if dimensions.get("supportiveness", 50) > 65:
-            style_parts.append("Be encouraging and empathetic")
-        
-        # Playfulness
-        if dimensions.get("playfulness", 50) > 65:
-            style_parts.append("Feel free to be witty and use humor when appropriate")
-        elif dimensions.get("playfulness", 50) < 35:
-            style_parts.append("Stay focused and serious")
-        
-        # Assertiveness
-        if dimensions.get("assertiveness", 50) < 35:
-            style_parts.append("Offer suggestions tentatively and ask for feedback")
-        elif dimensions.get("assertiveness", 50) > 65:
-            style_parts.append("Be confident and decisive in your responses")
-        
-        # Enthusiasm
-        if dimensions.get("enthusiasm", 50) > 65:
-            style_parts.append("Show genuine interest and energy in discussions")
-        elif dimensions.get("enthusiasm", 50) < 35:
-            style_parts.append("Maintain a calm and measured demeanor")
-        
-        # Combine style directives
-        if style_parts:
-            prompt_parts.append("Communication style: " + ". ".join(style_parts) + ".")
-        
-        # Add custom instructions if provided
-        if custom_instructions and custom_instructions.strip():
-            prompt_parts.append(f"\nAdditional guidance: {custom_instructions.strip()}")
-        
-        # IMPORTANT: Add anti-scripting reminder
-        prompt_parts.append("\nRespond naturally and authentically. Never use canned phrases or templated responses. Let each answer be unique and contextual.")
-        
-        return "\n\n".join(prompt_parts)
+        # Each dimension only matters as low/balanced/high, so nearby values
+        # share one cached prompt (and its KV cache in the model manager)
+        levels = frozenset(
+            (key, _dimension_level(dimensions.get(key, 50)))
+            for key in PersonalitySystem.PERSONALITY_DIMENSIONS
+        )
+        return _build_system_prompt(levels, (custom_instructions or "").strip())
     
     @staticmethod
     def get_preset(preset_name):
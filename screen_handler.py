@@ -4,55 +4,110 @@ Handles screen capture and automation (clicks, typing, mouse movement)
 WITH SAFETY FEATURES
 """
 
+import logging
+import threading
 import pyautogui
 import tempfile
+import cv2
+import mss
+import numpy as np
 from pathlib import Path
 from datetime import datetime
 from config import config
-from PIL import ImageGrab, Image
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# mss handles keep their GDI/X11 state per creating thread, so each Gradio
+# worker thread opens and reuses its own
+_capture = threading.local()
 
 class ScreenHandler:
     """Manages screen capture and automation"""
     
+    # Fixed attribute set - no per-instance __dict__, and typos fail loudly
+    __slots__ = ("_screen_size", "_template_cache")
+    
     def __init__(self):
         # Safety settings
         pyautogui.FAILSAFE = True  # Move to corner to abort
         pyautogui.PAUSE = 0.1  # Small delay between actions
         
-        print("🖥️ Screen Handler initialized")
-        print(f"   Screen size: {pyautogui.size()}")
-        print(f"   Failsafe: Enabled (move to corner to abort)")
+        # Cached - pyautogui.size() is a display round trip (XGetGeometry on X11)
+        self._screen_size = pyautogui.size()
+        
+        # Decoded BGR templates for find_image_on_screen, keyed by path
+        self._template_cache = {}
+        
+        logger.info("🖥️ Screen Handler initialized")
+        logger.info("   Screen size: %s", self._screen_size)
+        logger.info("   Failsafe: Enabled (move to corner to abort)")
+    
+    def _grabber(self):
+        """This thread's capture handle - grabs BGRA straight from the compositor"""
+        sct = getattr(_capture, "sct", None)
+        if sct is None:
+            sct = _capture.sct = mss.mss()
+        return sct
+    
+    def capture_screen_array(self, region=None):
+        """
+        Capture screen pixels without touching disk
+        region: (x, y, width, height) or None for full screen
+        Returns: RGB numpy array (height, width, 3), downscaled to MAX_SCREENSHOT_SIZE
+        """
+        sct = self._grabber()
+        if region:
+            x, y, width, height = region
+            monitor = {"left": x, "top": y, "width": width, "height": height}
+        else:
+            monitor = sct.monitors[0]  # All monitors combined
+        
+        frame = np.asarray(sct.grab(monitor))
+        
+        # Resize if too large - area averaging is far cheaper than LANCZOS
+        if config.MAX_SCREENSHOT_SIZE:
+            max_width, max_height = config.MAX_SCREENSHOT_SIZE
+            height, width = frame.shape[:2]
+            if width > max_width or height > max_height:
+                scale = min(max_width / width, max_height / height)
+                frame = cv2.resize(
+                    frame,
+                    (max(1, int(width * scale)), max(1, int(height * scale))),
+                    interpolation=cv2.INTER_AREA
+                )
+        
+        # Convert after resizing so only the smaller frame is copied
+        return cv2.cvtColor(frame, cv2.COLOR_BGRA2RGB)
     
     def capture_screen(self, region=None):
         """
         Capture screenshot
         region: (x, y, width, height) or None for full screen
         Returns: filepath
+        WebP is saved with SCREENSHOT_WEBP_METHOD: 0 encodes fastest,
+        6 gives the smallest files
         """
         try:
-            if region:
-                screenshot = ImageGrab.grab(bbox=region)
-            else:
-                screenshot = ImageGrab.grab()
-            
-            # Resize if too large
-            if config.MAX_SCREENSHOT_SIZE:
-                max_width, max_height = config.MAX_SCREENSHOT_SIZE
-                if screenshot.width > max_width or screenshot.height > max_height:
-                    screenshot.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
+            screenshot = Image.fromarray(self.capture_screen_array(region))
             
             # Save to temp file
             temp_dir = Path(config.TEMP_DIR)
             temp_dir.mkdir(exist_ok=True)
             
-            filepath = temp_dir / f"screenshot_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{config.SCREENSHOT_FORMAT}"
-            screenshot.save(filepath, quality=config.SCREENSHOT_QUALITY)
+            screenshot_format = config.SCREENSHOT_FORMAT.lower()
+            filepath = temp_dir / f"screenshot_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{screenshot_format}"
+            if screenshot_format == "webp":
+                screenshot.save(filepath, "WEBP", quality=config.SCREENSHOT_QUALITY,
+                                method=config.SCREENSHOT_WEBP_METHOD)
+            else:
+                screenshot.save(filepath, quality=config.SCREENSHOT_QUALITY, optimize=False)
             
-            print(f"✅ Screenshot captured: {filepath}")
+            logger.info("✅ Screenshot captured: %s", filepath)
             return str(filepath)
             
         except Exception as e:
-            print(f"⚠️ Error capturing screen: {e}")
+            logger.warning("⚠️ Error capturing screen: %s", e)
             return None
     
     def click(self, x, y, button='left', clicks=1, interval=0.0):
@@ -63,23 +118,23 @@ class ScreenHandler:
         interval: time between clicks
         """
         if config.REQUIRE_SCREEN_CONFIRMATION:
-            print(f"⚠️ Click requested at ({x}, {y})")
-            print("   (This would normally require confirmation)")
+            logger.warning("⚠️ Click requested at (%s, %s)", x, y)
+            logger.warning("   (This would normally require confirmation)")
         
         try:
             # Validate coordinates
-            screen_width, screen_height = pyautogui.size()
+            screen_width, screen_height = self._screen_size
             if not (0 <= x <= screen_width and 0 <= y <= screen_height):
                 return f"❌ Invalid coordinates: ({x}, {y}) - screen is {screen_width}x{screen_height}"
             
             pyautogui.click(x, y, clicks=clicks, interval=interval, button=button)
             
-            print(f"✅ Clicked at ({x}, {y})")
+            logger.info("✅ Clicked at (%s, %s)", x, y)
             return f"✅ Clicked at ({x}, {y})"
             
         except Exception as e:
             error_msg = f"❌ Click error: {e}"
-            print(error_msg)
+            logger.error(error_msg)
             return error_msg
     
     def double_click(self, x, y):
@@ -96,18 +151,18 @@ class ScreenHandler:
         duration: time to move (seconds)
         """
         try:
-            screen_width, screen_height = pyautogui.size()
+            screen_width, screen_height = self._screen_size
             if not (0 <= x <= screen_width and 0 <= y <= screen_height):
                 return f"❌ Invalid coordinates: ({x}, {y})"
             
             pyautogui.moveTo(x, y, duration=duration)
             
-            print(f"✅ Moved mouse to ({x}, {y})")
+            logger.info("✅ Moved mouse to (%s, %s)", x, y)
             return f"✅ Moved to ({x}, {y})"
             
         except Exception as e:
             error_msg = f"❌ Move error: {e}"
-            print(error_msg)
+            logger.error(error_msg)
             return error_msg
     
     def type_text(self, text, interval=0.0):
@@ -116,17 +171,17 @@ class ScreenHandler:
         interval: time between keystrokes
         """
         if config.REQUIRE_SCREEN_CONFIRMATION:
-            print(f"⚠️ Type requested: '{text[:50]}...'")
+            logger.warning("⚠️ Type requested: '%.50s...'", text)
         
         try:
             pyautogui.write(text, interval=interval)
             
-            print(f"✅ Typed text: {text[:50]}...")
+            logger.info("✅ Typed text: %.50s...", text)
             return f"✅ Typed: {text[:50]}{'...' if len(text) > 50 else ''}"
             
         except Exception as e:
             error_msg = f"❌ Type error: {e}"
-            print(error_msg)
+            logger.error(error_msg)
             return error_msg
     
     def press_key(self, key):
@@ -137,12 +192,12 @@ class ScreenHandler:
         try:
             pyautogui.press(key)
             
-            print(f"✅ Pressed key: {key}")
+            logger.info("✅ Pressed key: %s", key)
             return f"✅ Pressed: {key}"
             
         except Exception as e:
             error_msg = f"❌ Key press error: {e}"
-            print(error_msg)
+            logger.error(error_msg)
             return error_msg
     
     def hotkey(self, *keys):
@@ -154,12 +209,12 @@ class ScreenHandler:
             pyautogui.hotkey(*keys)
             
             combo = '+'.join(keys)
-            print(f"✅ Pressed hotkey: {combo}")
+            logger.info("✅ Pressed hotkey: %s", combo)
             return f"✅ Hotkey: {combo}"
             
         except Exception as e:
             error_msg = f"❌ Hotkey error: {e}"
-            print(error_msg)
+            logger.error(error_msg)
             return error_msg
     
     def scroll(self, clicks, x=None, y=None):
@@ -175,12 +230,12 @@ class ScreenHandler:
                 pyautogui.scroll(clicks)
             
             direction = "up" if clicks > 0 else "down"
-            print(f"✅ Scrolled {direction} by {abs(clicks)} clicks")
+            logger.info("✅ Scrolled %s by %d clicks", direction, abs(clicks))
             return f"✅ Scrolled {direction}"
             
         except Exception as e:
             error_msg = f"❌ Scroll error: {e}"
-            print(error_msg)
+            logger.error(error_msg)
             return error_msg
     
     def get_mouse_position(self):
@@ -190,9 +245,31 @@ class ScreenHandler:
     
     def get_screen_size(self):
         """Get screen dimensions"""
-        width, height = pyautogui.size()
+        width, height = self._screen_size
         return {"width": width, "height": height}
     
+    def refresh_screen_size(self):
+        """Re-read screen dimensions (call after a resolution or monitor change)"""
+        self._screen_size = pyautogui.size()
+        return self.get_screen_size()
+    
+    def _validate_sequence_coords(self, actions):
+        """
+        Check every absolute x/y in a sequence against the screen in one pass
+        Returns an error message for the first bad step, or None if all fit
+        """
+        width, height = self._screen_size
+        for i, action in enumerate(actions):
+            x, y = action.get("x"), action.get("y")
+            if x is None or y is None:
+                continue
+            numeric = all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in (x, y))
+            if not numeric:
+                return f"❌ Step {i+1}: coordinates must be numbers, got ({x!r}, {y!r})"
+            if not (0 <= x <= width and 0 <= y <= height):
+                return f"❌ Step {i+1}: invalid coordinates ({x}, {y}) - screen is {width}x{height}"
+        return None
+    
     def execute_action_sequence(self, actions):
         """
         Execute a sequence of actions
@@ -205,7 +282,14 @@ class ScreenHandler:
             {"type": "key", "key": "enter"}
         ]
         """
+        # Refuse the whole macro up front rather than failing half-way through
+        error = self._validate_sequence_coords(actions)
+        if error:
+            logger.error(error)
+            return error
+        
         results = []
+        cursor = None  # Last position we moved/clicked to, saves a position() query
         
         for i, action in enumerate(actions):
             action_type = action.get("type")
@@ -213,16 +297,19 @@ class ScreenHandler:
             try:
                 if action_type == "move":
                     result = self.move_mouse(action["x"], action["y"], action.get("duration", 0.5))
+                    cursor = (action["x"], action["y"])
                 
                 elif action_type == "click":
                     x = action.get("x")
                     y = action.get("y")
-                    if x is not None and y is not None:
-                        result = self.click(x, y, action.get("button", "left"))
-                    else:
+                    if x is None or y is None:
                         # Click at current position
-                        pos = self.get_mouse_position()
-                        result = self.click(pos["x"], pos["y"], action.get("button", "left"))
+                        if cursor is None:
+                            pos = self.get_mouse_position()
+                            cursor = (pos["x"], pos["y"])
+                        x, y = cursor
+                    result = self.click(x, y, action.get("button", "left"))
+                    cursor = (x, y)
                 
                 elif action_type == "type":
                     result = self.type_text(action["text"], action.get("interval", 0))
@@ -235,11 +322,15 @@ class ScreenHandler:
                 
                 elif action_type == "scroll":
                     result = self.scroll(action["clicks"], action.get("x"), action.get("y"))
+                    # pyautogui moves the pointer before a positioned scroll
+                    if action.get("x") is not None and action.get("y") is not None:
+                        cursor = (action["x"], action["y"])
                 
                 elif action_type == "wait":
                     import time
                     time.sleep(action.get("duration", 1.0))
                     result = f"✅ Waited {action.get('duration', 1.0)}s"
+                    cursor = None  # The user may have moved the mouse meanwhile
                 
                 else:
                     result = f"❌ Unknown action type: {action_type}"
@@ -249,7 +340,7 @@ class ScreenHandler:
             except Exception as e:
                 error = f"❌ Step {i+1} failed: {e}"
                 results.append(error)
-                print(error)
+                logger.error(error)
                 break  # Stop on first error
         
         return "\n".join(results)
@@ -260,16 +351,31 @@ class ScreenHandler:
         Returns: (x, y) of center or None
         """
         try:
-            import pyautogui
-            location = pyautogui.locateCenterOnScreen(image_path, confidence=confidence)
-            if location:
-                print(f"✅ Found image at {location}")
+            template = self._template_cache.get(image_path)
+            if template is None:
+                template = cv2.imread(str(image_path), cv2.IMREAD_COLOR)
+                if template is None:
+                    raise FileNotFoundError(f"Could not read image: {image_path}")
+                self._template_cache[image_path] = template
+            
+            # Full-resolution grab - matching must happen in screen pixels
+            sct = self._grabber()
+            screen = cv2.cvtColor(np.asarray(sct.grab(sct.monitors[0])), cv2.COLOR_BGRA2BGR)
+            
+            result = cv2.matchTemplate(screen, template, cv2.TM_CCOEFF_NORMED)
+            _, max_val, _, max_loc = cv2.minMaxLoc(result)
+            
+            if max_val >= confidence:
+                height, width = template.shape[:2]
+                location = (monitor["left"] + max_loc[0] + width // 2,
+                            monitor["top"] + max_loc[1] + height // 2)
+                logger.info("✅ Found image at %s", location)
                 return location
             else:
-                print("⚠️ Image not found on screen")
+                logger.info("⚠️ Image not found on screen")
                 return None
         except Exception as e:
-            print(f"⚠️ Image search error: {e}")
+            logger.warning("⚠️ Image search error: %s", e)
             return None
 
 # Global screen handler instance
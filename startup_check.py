@@ -3,23 +3,105 @@ Startup Check Script
 Validates system health before launching the LLM interface
 """
 
+import io
+import os
+import ast
 import sys
-import subprocess
-from pathlib import Path
+import json
+import time
+import signal
+import hashlib
+import argparse
+import importlib.util
+import importlib.metadata
+import functools
+import threading
+from types import MappingProxyType
+from dataclasses import dataclass, asdict
+from enum import IntEnum
+from concurrent.futures import ThreadPoolExecutor
+
+# Plain strings - no pathlib objects for throwaway joins
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CUDA_PROBE_FILE = os.path.join(BASE_DIR, "temp", "cuda_probe.json")
+RESULTS_CACHE_FILE = os.path.join(BASE_DIR, "temp", "startup_check.json")
+PREFLIGHT_FILE = os.path.join(BASE_DIR, "temp", "preflight.json")
+
+# Read-only views - safe for other tooling to import and enumerate
+REQUIRED_PACKAGES = MappingProxyType({
+    "torch": "PyTorch",
+    "transformers": "Transformers",
+    "gradio": "Gradio UI",
+    "bitsandbytes": "4-bit Quantization",
+    "accelerate": "Model Loading",
+})
+
+REQUIRED_DIRS = MappingProxyType({
+    "chat_histories": "Chat History Storage",
+    "context_files": "Context Files",
+    "uploads": "File Uploads",
+    "downloads": "Generated Downloads",
+    "logs": "Application Logs",
+    "temp": "Temporary Files"
+})
+
+# Checks run on worker threads; each one prints into its own buffer
+_output = threading.local()
+
+# Everything else is collected here and written to stdout in one go
+_OUT = []
+
+def _emit(text):
+    buffer = getattr(_output, "buffer", None)
+    if buffer is not None:
+        buffer.write(text)
+    else:
+        _OUT.append(text)
+
+def flush_output():
+    sys.stdout.write("".join(_OUT))
+    sys.stdout.flush()
+    _OUT.clear()
+
+_HEADER_BAR = "=" * 60
+_SYM_OK = "✓"
+_SYM_WARN = "⚠️"
+_SYM_FAIL = "✗"
+_SYM_INFO = "ℹ️"
+_SYM_OTHER = "•"
 
 def print_header(text):
-    print("\n" + "=" * 60)
-    print(f"  {text}")
-    print("=" * 60)
+    _emit(f"\n{_HEADER_BAR}\n  {text}\n{_HEADER_BAR}\n")
+
+def _symbol(status):
+    if status == "ok":
+        return _SYM_OK
+    elif status == "fail":
+        return _SYM_FAIL
+    elif status == "warn":
+        return _SYM_WARN
+    elif status == "info":
+        return _SYM_INFO
+    return _SYM_OTHER
+
+@functools.cache
+def _fmt(status, item):
+    """Padded status prefix - a few dozen distinct (status, item) pairs per run"""
+    return f"{_symbol(status)} {item:<40}"
 
 def print_status(item, status, details=""):
-    symbols = {"ok": "✓", "warn": "⚠️", "fail": "✗", "info": "ℹ️"}
-    symbol = symbols.get(status, "•")
-    print(f"{symbol} {item:<40}", end="")
     if details:
-        print(f" {details}")
+        _emit(f"{_fmt(status, item)} {details}\n")
     else:
-        print()
+        _emit(f"{_fmt(status, item)}\n")
+
+def _run_buffered(check):
+    """Run a check with its output captured, return (result, output)"""
+    _output.buffer = io.StringIO()
+    try:
+        return check(), _output.buffer.getvalue()
+    finally:
+        _output.buffer = None
 
 def check_python_version():
     print_header("Python Environment")
@@ -32,123 +114,504 @@ def check_python_version():
         print_status("Python Version", "warn", f"{version_str} (3.10+ recommended)")
         return True
 
-def check_required_packages():
+@functools.lru_cache(maxsize=None)
+def installed_version(package):
+    """Installed distribution version, or None if there's no metadata for it"""
+    try:
+        return importlib.metadata.version(package)
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+@functools.lru_cache(maxsize=None)
+def torch_cuda_build():
+    """
+    CUDA version the installed torch was built for, e.g. "12.1"
+    Read from torch/version.py without importing torch; None for a
+    CPU-only wheel or when torch can't be found
+    """
+    spec = importlib.util.find_spec("torch")
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    try:
+        with open(os.path.join(spec.submodule_search_locations[0], "version.py"), encoding="utf-8") as f:
+            tree = ast.parse(f.read())
+    except (OSError, SyntaxError):
+        return None
+    for node in tree.body:
+        # cuda: Optional[str] = '12.1'
+        if isinstance(node, (ast.Assign, ast.AnnAssign)) and node.value is not None:
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            if any(isinstance(target, ast.Name) and target.id == "cuda" for target in targets):
+                try:
+                    return ast.literal_eval(node.value)
+                except ValueError:
+                    return None
+    return None
+
+def check_required_packages(deep=False):
+    """
+    Check required packages are installed
+    deep: really import each one - catches broken installs, but importing
+    torch alone initializes CUDA and costs seconds plus GBs of RSS
+    """
     print_header("Required Packages")
-    required = {
-        "torch": "PyTorch",
-        "transformers": "Transformers",
-        "gradio": "Gradio UI",
-        "bitsandbytes": "4-bit Quantization",
-        "accelerate": "Model Loading",
-    }
     all_ok = True
-    for package, name in required.items():
-        try:
-            __import__(package)
-            print_status(name, "ok")
-        except ImportError:
+    for package, name in REQUIRED_PACKAGES.items():
+        # One small METADATA read - nothing is executed
+        version = installed_version(package)
+        
+        if deep:
+            try:
+                __import__(package)
+                found = True
+            except ImportError:
+                found = False
+        elif version is not None:
+            found = True
+        else:
+            # No dist-info (e.g. a source checkout on sys.path) - locate the module instead
+            found = importlib.util.find_spec(package) is not None
+        
+        if found:
+            print_status(name, "ok", version or "")
+        else:
             print_status(name, "fail", "Not installed")
             all_ok = False
     return all_ok
 
+# Each of these is a CUDA driver round trip - query once per process
+@functools.lru_cache(maxsize=None)
+def cached_cuda_available():
+    import torch
+    return torch.cuda.is_available()
+
+@functools.lru_cache(maxsize=None)
+def cached_device_name(index=0):
+    import torch
+    return torch.cuda.get_device_name(index)
+
+def _read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_json(path, data):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+    except OSError:
+        pass
+
+# Probe check_cuda produced in this process - None until it runs
+_run_probe = None
+
+def save_cuda_probe(probe):
+    """Write the probe so later processes can skip re-initializing CUDA"""
+    global _run_probe
+    _run_probe = probe
+    _write_json(CUDA_PROBE_FILE, probe)
+
+def load_cuda_probe():
+    """Read the last saved probe, or None if there isn't one"""
+    return _read_json(CUDA_PROBE_FILE)
+
+@dataclass(frozen=True)
+class GpuInfo:
+    """One GPU probe, computed once and printed on one line"""
+    name: str
+    mem_gb: float
+    free_gb: float
+    version: str  # "CUDA 12.1" from torch, "Driver 551.23" from nvidia-smi
+
+@functools.lru_cache(maxsize=None)
+def _query_nvidia_smi():
+    """
+    Every GPU nvidia-smi reports, in its own PCI bus order - no torch
+    import, no CUDA context. A tuple of GpuInfo, or None if nvidia-smi is
+    missing or fails; run once per process
+    """
+    # Imported here - app.py imports this module and never probes
+    import subprocess
+    
+    try:
+        result = subprocess.run(
+            ["nvidia-smi", "--query-gpu=name,memory.total,memory.free,driver_version",
+             "--format=csv,noheader,nounits"],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, timeout=2
+        )
+        if result.returncode != 0 or not result.stdout.strip():
+            return None
+        devices = []
+        for line in result.stdout.strip().splitlines():
+            name, total_mib, free_mib, driver = (field.strip() for field in line.split(","))
+            devices.append(GpuInfo(name, round(float(total_mib) * 2**20 / 1e9, 1),
+                                   round(float(free_mib) * 2**20 / 1e9, 1), f"Driver {driver}"))
+        return tuple(devices)
+    except (OSError, ValueError, subprocess.TimeoutExpired):
+        return None
+
+def _probe_nvidia_smi():
+    """
+    GPU info from nvidia-smi, one GpuInfo per device, or None if it can't answer
+    nvidia-smi ignores CUDA_VISIBLE_DEVICES and numbers GPUs in PCI bus
+    order, while CUDA defaults to fastest-first, so it also returns None
+    whenever its device 0 might not be CUDA's device 0
+    """
+    if os.environ.get("CUDA_VISIBLE_DEVICES") is not None:
+        return None
+    devices = _query_nvidia_smi()
+    if devices is None:
+        return None
+    if len(devices) > 1 and os.environ.get("CUDA_DEVICE_ORDER") != "PCI_BUS_ID":
+        return None
+    return list(devices)
+
+@functools.lru_cache(maxsize=None)
+def cached_device_count():
+    import torch
+    return torch.cuda.device_count()
+
+def _probe_torch():
+    """GPU info via torch, one GpuInfo per visible device (empty without CUDA)"""
+    import torch
+    if not cached_cuda_available():
+        return []
+    cuda_version = torch.version.cuda
+    devices = []
+    for index in range(cached_device_count()):
+        # Cheaper than loading the whole cudaDeviceProp per device, and adds free memory
+        free, total = torch.cuda.mem_get_info(index)
+        devices.append(GpuInfo(cached_device_name(index), round(total / 1e9, 1),
+                               round(free / 1e9, 1), f"CUDA {cuda_version}"))
+    return devices
+
+def _cuda_worker(conn):
+    """Child-process side of _probe_torch_isolated"""
+    try:
+        conn.send(("ok", [asdict(info) for info in _probe_torch()]))
+    except Exception as e:
+        conn.send(("error", str(e)))
+    finally:
+        conn.close()
+
+def _probe_torch_isolated():
+    """
+    Run _probe_torch in a spawned child process
+    CUDA init can leave GBs of RSS behind for good; when the child exits
+    it takes all of that with it instead of the caller keeping it
+    """
+    import multiprocessing
+    
+    ctx = multiprocessing.get_context("spawn")
+    reader, writer = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_cuda_worker, args=(writer,), daemon=True)
+    process.start()
+    writer.close()
+    try:
+        status, payload = reader.recv()
+    except EOFError:
+        process.join()
+        raise RuntimeError(f"CUDA probe process died (exit code {process.exitcode})")
+    finally:
+        reader.close()
+    process.join()
+    
+    if status == "error":
+        raise RuntimeError(payload)
+    return [GpuInfo(**fields) for fields in payload]
+
 def check_cuda():
     print_header("GPU Configuration")
     try:
-        import torch
-        if torch.cuda.is_available():
-            gpu_name = torch.cuda.get_device_name(0)
-            gpu_memory = torch.cuda.get_device_properties(0).total_memory / 1e9
-            print_status("CUDA Available", "ok", f"Version {torch.version.cuda}")
-            print_status("GPU Device", "ok", gpu_name)
-            print_status("GPU Memory", "ok", f"{gpu_memory:.1f}GB")
-            return True
-        else:
-            print_status("CUDA Available", "warn", "CPU mode only")
-            return False
+        # torch only when nvidia-smi can't answer - importing it initializes CUDA
+        devices = _probe_nvidia_smi()
+        if devices is None:
+            devices = _probe_torch_isolated()
     except Exception as e:
+        # Don't leave an older successful probe behind for readers of the file
+        save_cuda_probe({"available": False, "error": str(e)})
         print_status("CUDA Check", "fail", str(e))
         return False
+    
+    # nvidia-smi only proves a driver - a CPU-only wheel would still run the model on CPU
+    if devices and torch_cuda_build() is None:
+        save_cuda_probe({"available": False, "error": "PyTorch is a CPU-only build"})
+        print_status("CUDA Available", "warn", "GPU found, but PyTorch is a CPU-only build")
+        return False
+    
+    if not devices:
+        save_cuda_probe({"available": False})
+        print_status("CUDA Available", "warn", "CPU mode only")
+        return False
+    
+    # Top-level fields describe device 0, which the model loads onto
+    save_cuda_probe({"available": True, **asdict(devices[0]),
+                     "devices": [asdict(info) for info in devices]})
+    for index, info in enumerate(devices):
+        label = "GPU" if len(devices) == 1 else f"GPU {index}"
+        print_status(label, "ok", f"{info.name} | {info.mem_gb:.1f}GB ({info.free_gb:.1f}GB free) | {info.version}")
+    return True
+
+def _present_dirs():
+    with os.scandir(BASE_DIR) as entries:
+        return {entry.name for entry in entries if entry.is_dir()}
+
+def _make_dir(dir_name):
+    """Create one required directory, returning the error instead of raising"""
+    try:
+        os.makedirs(os.path.join(BASE_DIR, dir_name), exist_ok=True)
+    except Exception as e:
+        return e
+    return None
 
 def check_directories():
     print_header("Directory Structure")
-    base_dir = Path(__file__).parent
-    required_dirs = {
-        "chat_histories": "Chat History Storage",
-        "context_files": "Context Files",
-        "uploads": "File Uploads",
-        "downloads": "Generated Downloads",
-        "logs": "Application Logs",
-        "temp": "Temporary Files"
-    }
+    # One directory listing instead of a stat per entry
+    present = _present_dirs()
+    
+    # Create whatever is missing in parallel - inode writes don't have to queue
+    missing = [dir_name for dir_name in REQUIRED_DIRS if dir_name not in present]
+    errors = {}
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(len(missing), os.cpu_count() or 1)) as pool:
+            for dir_name, error in zip(missing, pool.map(_make_dir, missing)):
+                if error is not None:
+                    errors[dir_name] = error
+    
     all_ok = True
-    for dir_name, description in required_dirs.items():
-        dir_path = base_dir / dir_name
-        if dir_path.exists():
-            print_status(description, "ok")
-        else:
+    for dir_name, description in REQUIRED_DIRS.items():
+        dir_path = os.path.join(BASE_DIR, dir_name)
+        if dir_name not in present:
             print_status(description, "warn", "Creating...")
-            try:
-                dir_path.mkdir(parents=True, exist_ok=True)
-                print_status(f"  Created {dir_name}", "ok")
-            except Exception as e:
-                print_status(f"  Failed to create", "fail", str(e))
+            if dir_name in errors:
+                print_status(f"  Failed to create", "fail", str(errors[dir_name]))
                 all_ok = False
+                continue
+            print_status(f"  Created {dir_name}", "ok")
+        
+        # Existing isn't enough - e.g. a read-only volume mount fails much later
+        if not os.access(dir_path, os.W_OK):
+            print_status(description, "fail", "Not writable")
+            all_ok = False
+        elif dir_name in present:
+            print_status(description, "ok")
     return all_ok
 
-def run_all_checks():
-    print("\n" + "=" * 60)
-    print("  LOCAL LLM INTERFACE - SYSTEM HEALTH CHECK")
-    print("=" * 60)
-    print("  Optimized for: RTX 4080, 64GB RAM, Ryzen 7 7800X3D")
-    print("=" * 60)
+CHECK_NAMES = ("python", "packages", "cuda", "dirs")
+
+class CheckId(IntEnum):
+    PYTHON = 0
+    PACKAGES = 1
+    CUDA = 2
+    DIRS = 3
+
+CHECK_LABELS = MappingProxyType({
+    CheckId.PYTHON: "Python Version",
+    CheckId.PACKAGES: "Required Packages",
+    CheckId.CUDA: "GPU Configuration",
+    CheckId.DIRS: "Directory Structure",
+})
+
+# Failing any of these blocks launch; the rest are warnings
+CRITICAL_MASK = (1 << CheckId.PACKAGES) | (1 << CheckId.DIRS)
+
+def environment_fingerprint():
+    """
+    Hash of everything the checks depend on that can change between runs
+    Package versions come from dist-info metadata and the GPU identity from
+    nvidia-smi plus torch/version.py, so nothing is imported
+    """
+    versions = {package: installed_version(package) for package in REQUIRED_PACKAGES}
+    gpus = _query_nvidia_smi()
+    
+    present = _present_dirs()
+    state = {
+        "python": sys.version,
+        "packages": versions,
+        # Writability too - a cached pass mustn't hide a directory gone read-only
+        "dirs": [name in present and os.access(os.path.join(BASE_DIR, name), os.W_OK)
+                 for name in REQUIRED_DIRS],
+        "cuda_visible": os.environ.get("CUDA_VISIBLE_DEVICES"),
+        # A swapped, removed or re-drivered GPU must re-run the CUDA check
+        "gpus": None if gpus is None else [[info.name, info.version] for info in gpus],
+        "torch_cuda": torch_cuda_build(),
+    }
+    return hashlib.blake2b(json.dumps(state, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+def _load_cached_results(fingerprint):
+    cached = _read_json(RESULTS_CACHE_FILE)
+    if not isinstance(cached, dict) or cached.get("fingerprint") != fingerprint:
+        return None
+    try:
+        return [(CheckId(check_id), result) for check_id, result in cached["results"]]
+    except (KeyError, TypeError, ValueError):
+        return None  # Written by an older version
+
+def _save_cached_results(fingerprint, results):
+    _write_json(RESULTS_CACHE_FILE, {"fingerprint": fingerprint, "results": results})
+
+def write_preflight(results):
+    """Hand the probe results to the app launched next, so it needn't re-probe"""
+    status = dict(results)
+    _write_json(PREFLIGHT_FILE, {
+        "timestamp": time.time(),
+        "pid": os.getpid(),
+        # Only a probe from this run - the saved file may predate --skip-cuda/--only
+        "gpu": _run_probe,
+        "dirs_ready": status.get(CheckId.DIRS) is True,
+    })
+
+def load_preflight(max_age=60):
+    """Results of a startup check that passed within max_age seconds, else None"""
+    preflight = _read_json(PREFLIGHT_FILE)
+    if not isinstance(preflight, dict) or time.time() - preflight.get("timestamp", 0) > max_age:
+        return None
+    return preflight
+
+def run_all_checks(deep=False, only=CHECK_NAMES, skip_cuda=False, fresh=False):
+    # One stdout write per run - also when interrupted or a check raises
+    try:
+        success, results = _run_checks(deep, only, skip_cuda, fresh)
+    finally:
+        flush_output()
+    
+    # Cached results probed nothing this run - the saved GPU free memory is stale
+    if success and results is not None:
+        write_preflight(results)
+    return success
+
+def _run_checks(deep, only, skip_cuda, fresh):
+    _emit(
+        f"\n{_HEADER_BAR}\n  LOCAL LLM INTERFACE - SYSTEM HEALTH CHECK\n{_HEADER_BAR}\n"
+        f"  Optimized for: RTX 4080, 64GB RAM, Ryzen 7 7800X3D\n{_HEADER_BAR}\n"
+    )
+    
+    # CUDA_VISIBLE_DEVICES="" hides every GPU - don't pay for torch's CUDA init
+    if os.environ.get("CUDA_VISIBLE_DEVICES") == "":
+        skip_cuda = True
+    
+    # Only a plain full run is cached - partial/deep runs always execute
+    full_run = set(only) == set(CHECK_NAMES) and not (skip_cuda or deep)
+    fingerprint = environment_fingerprint() if full_run else None
+    if fingerprint and not fresh:
+        cached = _load_cached_results(fingerprint)
+        if cached is not None:
+            _emit("\nEnvironment unchanged since last successful check (use --fresh to re-run)\n")
+            return print_summary(cached), None
+    
+    checks = [
+        ("python", CheckId.PYTHON, check_python_version),
+        ("packages", CheckId.PACKAGES, functools.partial(check_required_packages, deep=deep)),
+        ("dirs", CheckId.DIRS, check_directories),
+    ]
+    checks = [(check_id, check) for key, check_id, check in checks if key in only]
     
+    # Independent and I/O bound - total time is the slowest check, not the sum
+    with ThreadPoolExecutor(max_workers=len(checks) + 1) as pool:
+        futures = {check_id: pool.submit(_run_buffered, check) for check_id, check in checks}
+        
+        # CUDA goes last and fails fast: with packages missing torch is too,
+        # so the GPU probe could only fail slowly
+        if "cuda" in only and not skip_cuda:
+            packages = futures.get(CheckId.PACKAGES)
+            if packages is not None and packages.result()[0] is False:
+                futures[CheckId.CUDA] = None
+            else:
+                futures[CheckId.CUDA] = pool.submit(_run_buffered, check_cuda)
+    
+    # Print in submission order so the report reads the same every run
     results = []
-    results.append(("Python Version", check_python_version()))
-    results.append(("Required Packages", check_required_packages()))
-    results.append(("GPU Configuration", check_cuda()))
-    results.append(("Directory Structure", check_directories()))
+    for check_id, future in futures.items():
+        if future is None:
+            results.append((check_id, None))
+            continue
+        result, output = future.result()
+        _OUT.append(output)
+        results.append((check_id, result))
     
+    success = print_summary(results)
+    if fingerprint and success:
+        _save_cached_results(fingerprint, results)
+    return success, results
+
+def print_summary(results):
     print_header("Summary")
-    critical_failed = 0
-    warnings = 0
+    fail_mask = 0
     
-    for name, result in results:
+    for check_id, result in results:
+        name = CHECK_LABELS[check_id]
         if result is False:
-            if name in ["Required Packages", "Directory Structure"]:
-                critical_failed += 1
+            fail_mask |= 1 << check_id
+            if CRITICAL_MASK >> check_id & 1:
                 print_status(name, "fail", "Critical issue")
             else:
-                warnings += 1
                 print_status(name, "warn", "Non-critical issue")
+        elif result is None:
+            print_status(name, "info", "Skipped - required packages missing")
         else:
             print_status(name, "ok")
     
-    print("\n" + "=" * 60)
+    critical_failed = bin(fail_mask & CRITICAL_MASK).count("1")
+    warnings = bin(fail_mask & ~CRITICAL_MASK).count("1")
     
     if critical_failed > 0:
-        print("❌ CRITICAL ISSUES FOUND")
-        print(f"   {critical_failed} critical check(s) failed")
-        print("   Run: pip install -r requirements.txt")
-        return False
+        verdict = ("❌ CRITICAL ISSUES FOUND\n"
+                   f"   {critical_failed} critical check(s) failed\n"
+                   "   Run: pip install -r requirements.txt\n")
+        success = False
     elif warnings > 0:
-        print("⚠️ WARNINGS DETECTED")
-        print(f"   {warnings} non-critical check(s) failed")
-        print("   You can proceed with: python app.py")
-        return True
+        verdict = ("⚠️ WARNINGS DETECTED\n"
+                   f"   {warnings} non-critical check(s) failed\n"
+                   "   You can proceed with: python app.py\n")
+        success = True
     else:
-        print("✅ ALL CHECKS PASSED")
-        print("   System is ready!")
-        print("   Start with: python app.py or launch.bat")
-        return True
+        verdict = ("✅ ALL CHECKS PASSED\n"
+                   "   System is ready!\n"
+                   "   Start with: python app.py or launch.bat\n")
+        success = True
+    
+    _emit(f"\n{_HEADER_BAR}\n{verdict}")
+    return success
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Validate system health before launching the LLM interface")
+    parser.add_argument("--deep", action="store_true",
+                        help="import every required package instead of only locating it (slow)")
+    parser.add_argument("--skip-cuda", action="store_true",
+                        help="skip the GPU check (avoids importing torch)")
+    parser.add_argument("--only", type=_check_list, default=CHECK_NAMES,
+                        help=f"comma-separated checks to run: {','.join(CHECK_NAMES)}")
+    parser.add_argument("--fresh", action="store_true",
+                        help="ignore cached results and run every check")
+    return parser.parse_args(argv)
+
+def _check_list(value):
+    names = tuple(name.strip() for name in value.split(",") if name.strip())
+    unknown = [name for name in names if name not in CHECK_NAMES]
+    if unknown or not names:
+        raise argparse.ArgumentTypeError(f"unknown check(s): {', '.join(unknown) or value!r}")
+    return names
+
+def _exit_on_interrupt(signum, frame):
+    """
+    Ctrl-C: leave immediately with the shell's usual 130
+    A normal exit would run interpreter teardown (and CUDA's, if torch got
+    loaded), which can hang for seconds - a stateless probe has nothing to clean up
+    """
+    os.write(sys.stdout.fileno(), "\n\n⚠️ Check interrupted\n".encode(sys.stdout.encoding or "utf-8", "replace"))
+    os._exit(130)
 
 if __name__ == "__main__":
+    signal.signal(signal.SIGINT, _exit_on_interrupt)
+    args = parse_args()
     try:
-        success = run_all_checks()
-        print("\n" + "=" * 60)
+        success = run_all_checks(deep=args.deep, only=args.only, skip_cuda=args.skip_cuda,
+                                 fresh=args.fresh)
+        sys.stdout.write(f"\n{_HEADER_BAR}\n")
         sys.exit(0 if success else 1)
-    except KeyboardInterrupt:
-        print("\n\n⚠️ Check interrupted")
-        sys.exit(1)
     except Exception as e:
         print(f"\n\n❌ Error: {e}")
         sys.exit(1)